@@ -95,4 +95,15 @@ async def get_current_seller(current_user: UserModel = Depends(get_current_user)
     """
     if current_user.role != "seller":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Только продавцы могут выполнить это действие")
-    return current_user
\ No newline at end of file
+    return current_user
+
+
+def require_role(role: str, detail: str):
+    """
+    Создает зависимость, которая пропускает только пользователей с указанной ролью.
+    """
+    async def check_role(current_user: UserModel = Depends(get_current_user)):
+        if current_user.role != role:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+        return current_user
+    return check_role
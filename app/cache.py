@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.categories import Category as CategoryModel
+
+
+class TTLCache:
+    """
+    Простой in-process кэш с ограниченным временем жизни и числом записей.
+    При переполнении вытесняются давно не использованные записи.
+
+    Каждый сброс ключа увеличивает его поколение: читатель запоминает поколение
+    до запроса к базе и передает его в set, чтобы не положить в кэш данные,
+    устаревшие из-за параллельной записи.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._generations: OrderedDict[Hashable, int] = OrderedDict()
+        self._generation_counter = 0
+        # Поколение ключей, вытесненных из _generations: не меньше любого выданного им ранее
+        self._base_generation = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def generation(self, key: Hashable) -> int:
+        return self._generations.get(key, self._base_generation)
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None) -> None:
+        if generation is not None and generation != self.generation(key):
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+        self._generation_counter += 1
+        self._generations[key] = self._generation_counter
+        self._generations.move_to_end(key)
+        while len(self._generations) > self.maxsize:
+            _, evicted = self._generations.popitem(last=False)
+            self._base_generation = evicted
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._generations.clear()
+        self._generation_counter += 1
+        self._base_generation = self._generation_counter
+
+
+# Категории меняются редко, поэтому их активность кэшируется в процессе.
+# Записи сбрасываются при изменении категории через роутер категорий
+category_status_cache = TTLCache(ttl=60, maxsize=1024)
+
+# Готовый JSON со списком отзывов товара кэшируется в процессе.
+# Запись сбрасывается при изменении отзывов и самого товара, но только в том
+# воркере, который обработал запись; в остальных она живет до истечения TTL,
+# поэтому TTL короткий
+product_reviews_cache = TTLCache(ttl=30, maxsize=1024)
+
+
+async def is_category_active(category_id: int, db: AsyncSession) -> bool:
+    """
+    Проверяет, что категория существует и активна, используя кэш.
+    """
+    is_active = category_status_cache.get(category_id)
+    if is_active is None:
+        generation = category_status_cache.generation(category_id)
+        result = await db.scalars(select(CategoryModel.id).where(CategoryModel.id == category_id,
+                                                                 CategoryModel.is_active == True))
+        is_active = result.first() is not None
+        category_status_cache.set(category_id, is_active, generation=generation)
+    return is_active
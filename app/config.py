@@ -4,4 +4,6 @@ from dotenv import load_dotenv
 
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = "HS256"
\ No newline at end of file
+ALGORITHM = "HS256"
+DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", "200"))
\ No newline at end of file
@@ -1,14 +1,34 @@
+from contextlib import asynccontextmanager
+
+from anyio import to_thread
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from app.config import THREAD_POOL_SIZE
+from app.middleware import ETagMiddleware
+from app.responses import ORJSONResponse, ImmutableStaticFiles
 from app.routers import categories, products, users, reviews, carts, orders
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Настраивает размер пула потоков, в котором выполняются файловые операции
+    и хэширование паролей.
+    """
+    to_thread.current_default_thread_limiter().total_tokens = THREAD_POOL_SIZE
+    yield
+
+
 app = FastAPI(
     title="FastAPI интернет-магазин",
     version="0.1.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
-app.mount("/media", StaticFiles(directory="media"), name="media")
+app.add_middleware(ETagMiddleware)
+
+# Имена изображений уникальны (хэш содержимого), поэтому файлы можно кэшировать навсегда
+app.mount("/media", ImmutableStaticFiles(directory="media"), name="media")
 
 app.include_router(categories.router)
 app.include_router(products.router)
@@ -0,0 +1,68 @@
+import hashlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class ETagMiddleware:
+    """
+    Добавляет ETag к успешным GET-ответам по указанным префиксам путей
+    и отвечает 304 без тела, если клиент прислал совпадающий If-None-Match.
+    Остальные запросы передаются приложению напрямую, без обертки.
+    """
+
+    def __init__(self, app: ASGIApp, path_prefixes: tuple[str, ...] = ("/products",)):
+        self.app = app
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (scope["type"] != "http"
+                or scope["method"] != "GET"
+                or not scope["path"].startswith(self.path_prefixes)):
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+        body_parts: list[bytes] = []
+        passthrough = False
+
+        async def send_with_etag(message: Message) -> None:
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                # Потоковые ответы (без Content-Length) и неуспешные не буферизуем
+                if message["status"] != 200 or "content-length" not in Headers(raw=message["headers"]):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message
+                return
+
+            body_parts.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(body_parts)
+            etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+
+            if_none_match = Headers(scope=scope).get("if-none-match")
+            if if_none_match:
+                client_etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+                if etag in client_etags or "*" in client_etags:
+                    await send({
+                        "type": "http.response.start",
+                        "status": 304,
+                        "headers": [(b"etag", etag.encode("latin-1"))],
+                    })
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["ETag"] = etag
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_with_etag)
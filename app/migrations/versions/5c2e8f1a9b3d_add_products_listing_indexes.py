@@ -0,0 +1,37 @@
+"""Add products listing indexes
+
+Revision ID: 5c2e8f1a9b3d
+Revises: de45e4d0569d
+Create Date: 2026-10-15 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2e8f1a9b3d'
+down_revision: Union[str, Sequence[str], None] = 'de45e4d0569d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Индекс создавался с опечаткой postgres_using и получился B-tree, пересоздаем как GIN
+    op.drop_index('ix_products_tsv_gin', table_name='products')
+    op.create_index('ix_products_tsv_gin', 'products', ['tsv'], unique=False, postgresql_using='gin')
+    op.create_index('ix_products_active_category_price', 'products', ['category_id', 'price'], unique=False,
+                    postgresql_where=sa.text('is_active'))
+    op.create_index('ix_products_active_seller', 'products', ['seller_id'], unique=False,
+                    postgresql_where=sa.text('is_active'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_active_seller', table_name='products', postgresql_where=sa.text('is_active'))
+    op.drop_index('ix_products_active_category_price', table_name='products', postgresql_where=sa.text('is_active'))
+    op.drop_index('ix_products_tsv_gin', table_name='products', postgresql_using='gin')
+    op.create_index('ix_products_tsv_gin', 'products', ['tsv'], unique=False)
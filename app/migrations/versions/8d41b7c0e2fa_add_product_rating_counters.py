@@ -0,0 +1,45 @@
+"""Add product rating counters
+
+Revision ID: 8d41b7c0e2fa
+Revises: 5c2e8f1a9b3d
+Create Date: 2026-10-15 11:04:17.562931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41b7c0e2fa'
+down_revision: Union[str, Sequence[str], None] = '5c2e8f1a9b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('products', sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('products', sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False))
+    # Заполняем счетчики по уже существующим активным отзывам
+    op.execute(
+        """
+        UPDATE products
+        SET rating_sum = r.grade_sum,
+            rating_count = r.grade_count
+        FROM (
+            SELECT product_id, SUM(grade) AS grade_sum, COUNT(*) AS grade_count
+            FROM reviews
+            WHERE is_active
+            GROUP BY product_id
+        ) AS r
+        WHERE products.id = r.product_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('products', 'rating_count')
+    op.drop_column('products', 'rating_sum')
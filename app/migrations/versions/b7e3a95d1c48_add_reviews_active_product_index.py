@@ -0,0 +1,30 @@
+"""Add reviews active product index
+
+Revision ID: b7e3a95d1c48
+Revises: 8d41b7c0e2fa
+Create Date: 2026-10-15 11:37:52.904416
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3a95d1c48'
+down_revision: Union[str, Sequence[str], None] = '8d41b7c0e2fa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_reviews_active_product_grade', 'reviews', ['product_id'], unique=False,
+                    postgresql_include=['grade'], postgresql_where=sa.text('is_active'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_reviews_active_product_grade', table_name='reviews',
+                  postgresql_include=['grade'], postgresql_where=sa.text('is_active'))
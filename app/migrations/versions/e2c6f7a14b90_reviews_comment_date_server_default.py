@@ -0,0 +1,36 @@
+"""Reviews comment_date server default
+
+Revision ID: e2c6f7a14b90
+Revises: b7e3a95d1c48
+Create Date: 2026-10-15 12:04:18.517203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2c6f7a14b90'
+down_revision: Union[str, Sequence[str], None] = 'b7e3a95d1c48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('reviews', 'comment_date',
+                    existing_type=sa.DateTime(),
+                    type_=sa.DateTime(timezone=True),
+                    server_default=sa.text('now()'),
+                    existing_nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('reviews', 'comment_date',
+                    existing_type=sa.DateTime(timezone=True),
+                    type_=sa.DateTime(),
+                    server_default=None,
+                    existing_nullable=False)
@@ -0,0 +1,62 @@
+"""Add reviews user product unique index
+
+Revision ID: f41a9d3c6e27
+Revises: e2c6f7a14b90
+Create Date: 2026-10-15 12:31:45.280917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f41a9d3c6e27'
+down_revision: Union[str, Sequence[str], None] = 'e2c6f7a14b90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Оставляем активным только последний отзыв пользователя на товар
+    op.execute(
+        """
+        UPDATE reviews
+        SET is_active = false
+        FROM reviews AS newer
+        WHERE newer.user_id = reviews.user_id
+          AND newer.product_id = reviews.product_id
+          AND newer.is_active
+          AND reviews.is_active
+          AND newer.id > reviews.id
+        """
+    )
+    # Пересчитываем рейтинг товаров после отключения дубликатов
+    op.execute(
+        """
+        UPDATE products
+        SET rating_sum = r.grade_sum,
+            rating_count = r.grade_count,
+            rating = r.grade_avg
+        FROM (
+            SELECT products.id AS product_id,
+                   COALESCE(SUM(reviews.grade), 0) AS grade_sum,
+                   COUNT(reviews.id) AS grade_count,
+                   ROUND(AVG(reviews.grade), 2) AS grade_avg
+            FROM products
+            LEFT JOIN reviews ON reviews.product_id = products.id AND reviews.is_active
+            GROUP BY products.id
+        ) AS r
+        WHERE products.id = r.product_id
+        """
+    )
+    op.create_index('uq_reviews_user_product_active', 'reviews', ['user_id', 'product_id'], unique=True,
+                    postgresql_where=sa.text('is_active'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_reviews_user_product_active', table_name='reviews',
+                  postgresql_where=sa.text('is_active'))
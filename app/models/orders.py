@@ -17,6 +17,9 @@ class Order(Base):
     user: Mapped["User"] = relationship("User", back_populates="orders")
     items: Mapped[list["OrderItem"]] = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
+    # created_at/updated_at возвращаются из INSERT/UPDATE через RETURNING без отдельного SELECT
+    __mapper_args__ = {"eager_defaults": True}
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
@@ -1,5 +1,5 @@
 from decimal import Decimal
-from sqlalchemy import String, Boolean, Integer, Numeric, ForeignKey, Computed, Index
+from sqlalchemy import String, Boolean, Integer, Numeric, ForeignKey, Computed, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import TSVECTOR
 from app.database import Base
@@ -18,6 +18,8 @@ class Product(Base):
     category_id: Mapped[int] = mapped_column(ForeignKey("categories.id"), nullable=False)
     seller_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
     rating: Mapped[Decimal | None] = mapped_column(Numeric(3, 2), nullable=True)
+    rating_sum: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    rating_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
 
     tsv: Mapped[TSVECTOR] = mapped_column(
         TSVECTOR,
@@ -38,5 +40,7 @@ class Product(Base):
     order_items: Mapped[list["OrderItem"]] = relationship("OrderItem", back_populates="product")
 
     __table_args__ = (
-        Index("ix_products_tsv_gin", "tsv", postgres_using="gin"),
+        Index("ix_products_tsv_gin", "tsv", postgresql_using="gin"),
+        Index("ix_products_active_category_price", "category_id", "price", postgresql_where=text("is_active")),
+        Index("ix_products_active_seller", "seller_id", postgresql_where=text("is_active")),
     )
\ No newline at end of file
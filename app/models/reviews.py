@@ -1,4 +1,4 @@
-from sqlalchemy import String, Boolean, Integer, ForeignKey, DateTime
+from sqlalchemy import String, Boolean, Integer, ForeignKey, DateTime, Index, text, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.database import Base
 from datetime import datetime
@@ -12,9 +12,17 @@ class Review(Base):
     product_id: Mapped[int] = mapped_column(ForeignKey("products.id"), nullable=False)
     comment:  Mapped[str | None] = mapped_column(String(500), nullable=True)
     comment_date: Mapped[datetime] = mapped_column(
-        DateTime(timezone=False),
-        default=datetime.now,
+        DateTime(timezone=True),
+        server_default=func.now(),
         nullable=False
     )
     grade: Mapped[int] = mapped_column(Integer, nullable=False)
-    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
\ No newline at end of file
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+
+    __table_args__ = (
+        Index("ix_reviews_active_product_grade", "product_id",
+              postgresql_include=["grade"], postgresql_where=text("is_active")),
+        # Один активный отзыв пользователя на товар
+        Index("uq_reviews_user_product_active", "user_id", "product_id",
+              unique=True, postgresql_where=text("is_active")),
+    )
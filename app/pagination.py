@@ -0,0 +1,30 @@
+from collections.abc import Sequence
+from typing import Any
+
+from sqlalchemy import Select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def fetch_page(db: AsyncSession, stmt: Select, count_stmt: Select, offset: int | None,
+                     params: dict[str, Any] | None = None) -> tuple[Sequence[Any], int]:
+    """
+    Возвращает элементы страницы и общее количество записей.
+    При постраничном режиме количество берется оконной функцией из того же запроса;
+    при курсоре (offset=None) выборка сужена, поэтому оно считается отдельным запросом.
+    """
+    if offset is None:
+        total = await db.scalar(count_stmt, params) or 0
+        items = (await db.scalars(stmt, params)).all()
+        return items, total
+
+    rows = (await db.execute(stmt.add_columns(func.count().over().label("total_count")).offset(offset),
+                             params)).all()
+    items = [row[0] for row in rows]
+    if rows:
+        total = rows[0].total_count
+    elif offset > 0:
+        # Страница за пределами выборки: строк нет, считаем отдельно
+        total = await db.scalar(count_stmt, params) or 0
+    else:
+        total = 0
+    return items, total
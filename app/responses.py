@@ -0,0 +1,40 @@
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi import Response
+from fastapi.responses import ORJSONResponse as BaseORJSONResponse
+from fastapi.staticfiles import StaticFiles
+
+
+def _orjson_default(value: Any) -> Any:
+    """
+    Сериализует типы, которые orjson не поддерживает из коробки.
+    Decimal передается строкой, чтобы не терять точность цен.
+    """
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError
+
+
+class ORJSONResponse(BaseORJSONResponse):
+    """
+    JSON-ответ на базе orjson с поддержкой Decimal.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    Раздача статических файлов с долгосрочным кэшированием в браузере и на CDN.
+    Подходит для файлов, содержимое которых по одному URL никогда не меняется.
+    """
+
+    cache_control = "public, max-age=31536000, immutable"
+
+    def file_response(self, *args: Any, **kwargs: Any) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", self.cache_control)
+        return response
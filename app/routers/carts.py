@@ -1,10 +1,11 @@
-from decimal import Decimal
 from fastapi import APIRouter, Depends, HTTPException, status, Response
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, func, literal, bindparam
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.auth import get_current_user
+from app.database import STRICT_LOADING
 from app.db_depends import get_async_db
 from app.models.cart_items import CartItem as CartItemModel
 from app.models.products import Product as ProductModel
@@ -19,38 +20,44 @@ from app.schemas import (
 
 router = APIRouter(prefix="/carts", tags=["carts"])
 
+# Запросы собираются один раз при импорте
+_cart_item_stmt = (select(CartItemModel)
+                   .options(selectinload(CartItemModel.product), *STRICT_LOADING)
+                   .where(CartItemModel.user_id == bindparam("user_id"),
+                          CartItemModel.product_id == bindparam("product_id"),)
+                   )
+_cart_items_stmt = (select(CartItemModel)
+                    .options(selectinload(CartItemModel.product), *STRICT_LOADING)
+                    .where(CartItemModel.user_id == bindparam("user_id"))
+                    .order_by(CartItemModel.id)
+                    )
+_cart_totals_stmt = (select(func.coalesce(func.sum(CartItemModel.quantity), 0),
+                            func.coalesce(func.sum(CartItemModel.quantity * ProductModel.price), 0))
+                     .select_from(CartItemModel)
+                     .join(ProductModel, ProductModel.id == CartItemModel.product_id)
+                     .where(CartItemModel.user_id == bindparam("user_id"))
+                     )
+
 
 async def _ensure_product_available(product_id: int, db: AsyncSession) -> None:
-    result = await db.scalars(select(ProductModel).where(ProductModel.id == product_id, ProductModel.is_active == True,))
-    product = result.first()
-    if product is None:
+    product = await db.get(ProductModel, product_id)
+    if product is None or not product.is_active:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Продукт не найден или неактивен")
     
 
 async def _get_cart_item(user_id: int, product_id: int, db: AsyncSession) -> CartItemModel | None:
-    result = await db.scalars(select(CartItemModel)
-                              .options(selectinload(CartItemModel.product))
-                              .where(CartItemModel.user_id == user_id, CartItemModel.product_id == product_id,)
-                              )
+    result = await db.scalars(_cart_item_stmt, {"user_id": user_id, "product_id": product_id})
     return result.first()
 
 
 @router.get("/", response_model=CartSchema)
 async def get_carts(db: AsyncSession = Depends(get_async_db), current_user: UserModel = Depends(get_current_user),):
-    result = await db.scalars(select(CartItemModel)
-                              .options(selectinload(CartItemModel.product))
-                              .where(CartItemModel.user_id == current_user.id)
-                              .order_by(CartItemModel.id)
-                              )
+    result = await db.scalars(_cart_items_stmt, {"user_id": current_user.id})
     items = result.all()
 
-    total_quantity = sum(item.quantity for item in items)
-    price_items = (
-        Decimal(item.quantity) *
-        (item.product.price if item.product.price is not None else Decimal("0"))
-        for item in items
-    )
-    total_price_decimal = sum(price_items, Decimal("0"))
+    # Итоги считаем на стороне БД, а не перемножая Decimal в Python
+    totals = await db.execute(_cart_totals_stmt, {"user_id": current_user.id})
+    total_quantity, total_price_decimal = totals.one()
 
     return CartSchema(
         user_id=current_user.id,
@@ -62,22 +69,27 @@ async def get_carts(db: AsyncSession = Depends(get_async_db), current_user: User
 
 @router.post("/items", response_model=CartItemSchema, status_code=status.HTTP_201_CREATED)
 async def add_item_to_cart(payload: CartItemCreate, current_user: UserModel = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
-    await _ensure_product_available(payload.product_id, db)
-
-    cart_item = await _get_cart_item(current_user.id, payload.product_id, db)
-    if cart_item:
-        cart_item.quantity += payload.quantity
-    else:
-        cart_item = CartItemModel(
-            user_id=current_user.id,
-            product_id=payload.product_id,
-            quantity=payload.quantity,
-        )
-        db.add(cart_item)
+    # Вставка строки происходит только если товар существует и активен,
+    # при повторном добавлении увеличиваем количество в уже существующей позиции
+    insert_stmt = insert(CartItemModel).from_select(
+        ["user_id", "product_id", "quantity"],
+        select(literal(current_user.id), ProductModel.id, literal(payload.quantity))
+        .where(ProductModel.id == payload.product_id, ProductModel.is_active == True,)
+    )
+    upsert_stmt = (insert_stmt
+                   .on_conflict_do_update(index_elements=[CartItemModel.user_id, CartItemModel.product_id],
+                                          set_={"quantity": CartItemModel.quantity + insert_stmt.excluded.quantity,
+                                                "updated_at": func.now()},
+                                          )
+                   .returning(CartItemModel)
+                   )
+    cart_item = await db.scalar(upsert_stmt, execution_options={"populate_existing": True})
+    if cart_item is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Продукт не найден или неактивен")
 
     await db.commit()
-    updated_item = await _get_cart_item(current_user.id, payload.product_id, db)
-    return updated_item
+    await db.refresh(cart_item, attribute_names=["product"])
+    return cart_item
 
 
 @router.put("/items/{product_id}", response_model=CartItemSchema)
@@ -90,8 +102,7 @@ async def update_cart_item(product_id: int, payload: CartItemUpdate, current_use
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Корзина не найдена")
     cart_item.quantity = payload.quantity
     await db.commit()
-    updated_item = await _get_cart_item(current_user.id, product_id, db)
-    return updated_item
+    return cart_item
 
 
 @router.delete("/items/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends,HTTPException, status
 from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.cache import category_status_cache
 from app.models.categories import Category as CategoryModel
 from app.schemas import Category as CategorySchema, CategoryCreate
 from app.db_depends import get_async_db
@@ -28,16 +29,14 @@ async def create_category(category: CategoryCreate, db: AsyncSession = Depends(g
     Создаёт новую категорию.
     """
     if category.parent_id is not None:
-        stmt = select(CategoryModel).where(CategoryModel.id == category.parent_id,
-                                           CategoryModel.is_active == True)
-        result = await db.scalars(stmt)
-        parent = result.first()
-        if parent is None:
+        parent = await db.get(CategoryModel, category.parent_id)
+        if parent is None or not parent.is_active:
             raise HTTPException(status_code=400, detail="Родительская категория не найдена.")
         
     db_category = CategoryModel(**category.model_dump())
     db.add(db_category)
     await db.commit()
+    category_status_cache.invalidate(db_category.id)
     return db_category
 
 
@@ -47,20 +46,14 @@ async def update_category(category_id: int, category: CategoryCreate, db: AsyncS
     Обновляет категорию по её ID.
     """
     # Проверяем существование категории
-    stmt = select(CategoryModel).where(CategoryModel.id == category_id,
-                                       CategoryModel.is_active == True)
-    result = await db.scalars(stmt)
-    db_category = result.first()
-    if not db_category:
+    db_category = await db.get(CategoryModel, category_id)
+    if db_category is None or not db_category.is_active:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Категория не найдена")
 
     # Проверяем parent_id, если указан
     if category.parent_id is not None:
-        parent_stmt = select(CategoryModel).where(CategoryModel.id == category.parent_id,
-                                                  CategoryModel.is_active == True)
-        parent_result = await db.scalars(parent_stmt)
-        parent = parent_result.first()
-        if parent is None:
+        parent = await db.get(CategoryModel, category.parent_id)
+        if parent is None or not parent.is_active:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Родительская категория не найдена")
         if parent.id == category_id:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Категория не может быть своей собственной родительской")
@@ -73,6 +66,7 @@ async def update_category(category_id: int, category: CategoryCreate, db: AsyncS
         .values(**update_data)
     )
     await db.commit()
+    category_status_cache.invalidate(category_id)
     return db_category
 
 
@@ -82,10 +76,8 @@ async def delete_category(category_id: int, db: AsyncSession = Depends(get_async
     Логически удаляет категорию по её ID, устанавливая is_active=False.
     """
     # Проверка существования активной категории.
-    stmt = select(CategoryModel). where(CategoryModel.id == category_id, CategoryModel.is_active == True)
-    result = await db.scalars(stmt)
-    db_category = result.first()
-    if db_category is None:
+    db_category = await db.get(CategoryModel, category_id)
+    if db_category is None or not db_category.is_active:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Категория не найдена")
     
     # Логическое удаление категории (установка is_active=False)
@@ -95,5 +87,6 @@ async def delete_category(category_id: int, db: AsyncSession = Depends(get_async
         .values(is_active=False)
         )
     await db.commit()
+    category_status_cache.invalidate(category_id)
 
     return db_category
\ No newline at end of file
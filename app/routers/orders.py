@@ -1,26 +1,41 @@
 from decimal import Decimal
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy import select, delete, func
+from sqlalchemy import select, delete, func, tuple_, update, insert, values, column, Integer, bindparam
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.auth import get_current_user
+from app.database import STRICT_LOADING
 from app.db_depends import get_async_db
+from app.pagination import fetch_page
 from app.models.cart_items import CartItem as CartItemModel
 from app.models.orders import Order as OrderModel, OrderItem as OrderItemModel
+from app.models.products import Product as ProductModel
 from app.models.users import User as UserModel
 from app.schemas import Order as OrderSchema, OrderList
 
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
+_cart_items_stmt = (select(CartItemModel)
+                    .options(*STRICT_LOADING)
+                    .where(CartItemModel.user_id == bindparam("user_id"))
+                    .order_by(CartItemModel.id)
+                    )
+_user_orders_stmt = (select(OrderModel)
+                     .options(selectinload(OrderModel.items).selectinload(OrderItemModel.product), *STRICT_LOADING)
+                     .where(OrderModel.user_id == bindparam("user_id"))
+                     .order_by(OrderModel.created_at.desc(), OrderModel.id.desc())
+                     )
+_user_orders_count_stmt = select(func.count(OrderModel.id)).where(OrderModel.user_id == bindparam("user_id"))
+
 
 async def _load_order_with_items(order_id: int, sb: AsyncSession) -> OrderModel | None:
-    result = await sb.scalars(select(OrderModel)
-                              .options(selectinload(OrderModel.items).selectinload(OrderItemModel.product),)
-                              .where(OrderModel.id == order_id)
-                              )
-    return result.first()
+    return await sb.get(OrderModel, order_id,
+                        options=[selectinload(OrderModel.items).selectinload(OrderItemModel.product), *STRICT_LOADING],
+                        populate_existing=True,
+                        )
 
 
 @router.post("/checkout", response_model=OrderSchema, status_code=status.HTTP_201_CREATED)
@@ -29,52 +44,71 @@ async def checkout_order(current_user: UserModel = Depends(get_current_user), db
     Создает заказ на основе текущей корзины пользователя.
     Сохраняет позиции заказа, вычитает остатки и очищает корзину.
     """
-    cart_result = await db.scalars(select(CartItemModel)
-                                   .options(selectinload(CartItemModel.product))
-                                   .where(CartItemModel.user_id == current_user.id)
-                                   .order_by(CartItemModel.id)
-                                   )
+    cart_result = await db.scalars(_cart_items_stmt, {"user_id": current_user.id})
     cart_items = cart_result.all()
-    if cart_items is None:
+    if not cart_items:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Корзина пуста")
-    
+
+    # Списываем остатки одним UPDATE ... FROM (VALUES ...): проверка активности и остатка
+    # выполняется атомарно в WHERE, а актуальные строки товаров возвращаются через RETURNING.
+    # Строки VALUES сортируются по ID товара, чтобы блокировки брались в одном порядке
+    # у всех покупателей и параллельные оформления не взаимоблокировались
+    stock_values = (values(column("product_id", Integer), column("quantity", Integer), name="cart_stock")
+                    .data(sorted((cart_item.product_id, cart_item.quantity) for cart_item in cart_items))
+                    )
+    updated_result = await db.execute(
+        update(ProductModel)
+        .where(ProductModel.id == stock_values.c.product_id,
+               ProductModel.is_active == True,
+               ProductModel.stock >= stock_values.c.quantity)
+        .values(stock=ProductModel.stock - stock_values.c.quantity)
+        .returning(ProductModel),
+        execution_options={"synchronize_session": False, "populate_existing": True},
+    )
+    products = {product.id: product for product in updated_result.scalars().all()}
+
     order = OrderModel(user_id=current_user.id)
     total_amount = Decimal("0")
+    order_items_data = []
 
     for cart_item in cart_items:
-        product = cart_item.product
-        if product is None or product.is_active is None:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Продукт {cart_item.product_id} недоступен")
-        if product.stock < cart_item.quantity:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Недостаточно товара на складе {product.name}")
-        
+        product = products.get(cart_item.product_id)
+        if product is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Продукт {cart_item.product_id} недоступен или его недостаточно на складе")
+
         unit_price = product.price
-        if unit_price is None:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Цена на товар {product.name} не установлена")
-        
         total_price = unit_price * cart_item.quantity
         total_amount += total_price
 
-        order_item = OrderItemModel(
-            product_id = cart_item.product_id,
-            quantity = cart_item.quantity,
-            unit_price = unit_price,
-            total_price = total_price,
-        )
-        order.items.append(order_item)
-        product.stock -= cart_item.quantity
+        order_items_data.append({
+            "product_id": cart_item.product_id,
+            "quantity": cart_item.quantity,
+            "unit_price": unit_price,
+            "total_price": total_price,
+        })
 
     order.total_amount = total_amount
     db.add(order)
+    await db.flush()
+
+    # Все позиции заказа вставляются одним многострочным INSERT ... VALUES
+    items_result = await db.scalars(
+        insert(OrderItemModel)
+        .values([{"order_id": order.id, **item_data} for item_data in order_items_data])
+        .returning(OrderItemModel)
+    )
+    order_items = items_result.all()
+
+    # Собираем ответ из уже загруженных объектов вместо повторного чтения заказа
+    for order_item in order_items:
+        set_committed_value(order_item, "product", products[order_item.product_id])
+    set_committed_value(order, "items", order_items)
 
     await db.execute(delete(CartItemModel).where(CartItemModel.user_id == current_user.id))
     await db.commit()
 
-    created_order = await _load_order_with_items(order.id, db)
-    if created_order is None:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Не удалось загрузить созданный заказ")
-    
-    return created_order
+    return order
 
 
 @router.get("/", response_model=OrderList)
@@ -82,24 +116,27 @@ async def list_orders(
     current_user: UserModel = Depends(get_current_user),
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
+    cursor: int | None = Query(None, ge=1, description="ID последнего заказа предыдущей страницы (вместо page)"),
     db: AsyncSession = Depends(get_async_db),
 ):
     """
-    Возвращает заказы текущего пользователя с простой пагинацией.
+    Возвращает заказы текущего пользователя с пагинацией по странице или по курсору.
     """
-    total = await db.scalar(select(func.count(OrderModel.id))
-                            .where(OrderModel.user_id == current_user.id)
-                            )
-    result = await db.scalars(
-        select(OrderModel)
-        .options(selectinload(OrderModel.items).selectinload(OrderItemModel.product))
-        .where(OrderModel.user_id == current_user.id)
-        .order_by(OrderModel.created_at.desc())
-        .offset((page-1) * page_size)
-        .limit(page_size)
-    )
-    orders = result.all()
-    return OrderList(items=orders, total=total or 0, page=page, page_size=page_size)
+    params = {"user_id": current_user.id}
+    orders_stmt = _user_orders_stmt.limit(page_size)
+    if cursor is not None:
+        # Keyset-пагинация по (created_at, id) относительно заказа-курсора
+        cursor_created_at = await db.scalar(select(OrderModel.created_at)
+                                            .where(OrderModel.id == cursor, OrderModel.user_id == current_user.id))
+        if cursor_created_at is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Некорректный курсор")
+        orders_stmt = orders_stmt.where(tuple_(OrderModel.created_at, OrderModel.id) < tuple_(cursor_created_at, cursor))
+    orders, total = await fetch_page(db, orders_stmt, _user_orders_count_stmt,
+                                     offset=None if cursor is not None else (page - 1) * page_size,
+                                     params=params)
+
+    next_cursor = orders[-1].id if len(orders) == page_size else None
+    return OrderList(items=orders, total=total, page=page, page_size=page_size, next_cursor=next_cursor)
 
 
 @router.get("/{order_id}", response_model=OrderSchema)
@@ -1,5 +1,7 @@
 from pathlib import Path
+import hashlib
 import uuid
+import anyio
 from fastapi import UploadFile, File, Form
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
@@ -11,7 +13,9 @@ from app.models.categories import Category as CategoryModel
 from app.models.users import User as UserModel
 from app.schemas import Product as ProductSchema, ProductCreate, ProductList
 from app.db_depends import get_async_db
+from app.pagination import fetch_page
 from app.auth import get_current_seller
+from app.cache import is_category_active, product_reviews_cache
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -19,6 +23,7 @@ MEDIA_ROOT = BASE_DIR / "media" / "products"
 MEDIA_ROOT.mkdir(parents=True, exist_ok=True)
 ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp"}
 MAX_IMAGE_SIZE = 2 * 1024 * 1024
+IMAGE_CHUNK_SIZE = 64 * 1024
 
 router = APIRouter(
     prefix="/products",
@@ -32,36 +37,75 @@ async def save_product_image(file: UploadFile) -> str:
     """
     if file.content_type not in ALLOWED_IMAGE_TYPES:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Разрешены только изображения в формате JPG, PNG или WebP")
-    
-    content = await file.read()
-    if len(content) > MAX_IMAGE_SIZE:
+    if file.size is not None and file.size > MAX_IMAGE_SIZE:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Размер изображения слишком большой")
     
     extension = Path(file.filename or "").suffix.lower() or ".jpg"
-    file_name = f"{uuid.uuid4()}{extension}"
-    file_path = MEDIA_ROOT / file_name
-    file_path.write_bytes(content)
+    tmp_path = anyio.Path(MEDIA_ROOT / f"{uuid.uuid4().hex}.part")
+
+    # Копируем файл частями во временный файл, не держа его целиком в памяти,
+    # и попутно считаем хэш содержимого для имени файла
+    size = 0
+    hasher = hashlib.blake2b(digest_size=16)
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as buffer:
+            while chunk := await file.read(IMAGE_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_IMAGE_SIZE:
+                    raise HTTPException(status.HTTP_400_BAD_REQUEST, "Размер изображения слишком большой")
+                hasher.update(chunk)
+                await buffer.write(chunk)
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            await tmp_path.unlink(missing_ok=True)
+        raise
+
+    # Одинаковые изображения получают одно имя и хранятся в одном файле.
+    # Замена атомарна: в media никогда не попадет недописанный файл
+    file_name = f"{hasher.hexdigest()}{extension}"
+    await tmp_path.replace(MEDIA_ROOT / file_name)
 
     return f"/media/products/{file_name}"
 
 
-def remove_product_image(url: str | None) -> None:
+async def remove_product_image(url: str | None, product_id: int, db: AsyncSession) -> None:
     """
-    Удаляет файл изображения, если он существует.
+    Удаляет файл изображения, если он существует и не используется другими товарами.
     """
     if not url:
         return
     
+    shared_result = await db.scalars(select(ProductModel.id)
+                                     .where(ProductModel.image_url == url, ProductModel.id != product_id)
+                                     .limit(1))
+    if shared_result.first() is not None:
+        return
+
     relative_path = url.lstrip("/")
-    file_path = BASE_DIR / relative_path
-    if file_path.exists():
-        file_path.unlink()
+    file_path = anyio.Path(BASE_DIR / relative_path)
+    await file_path.unlink(missing_ok=True)
+
+
+async def _product_mutation_error(product_id: int, seller_id: int, db: AsyncSession,
+                                  forbidden_detail: str, category_detail: str) -> HTTPException:
+    """
+    Определяет, почему UPDATE товара не затронул ни одной строки.
+    """
+    result = await db.scalars(select(ProductModel.seller_id)
+                              .where(ProductModel.id == product_id, ProductModel.is_active == True))
+    owner_id = result.first()
+    if owner_id is None:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Продукт не найден")
+    if owner_id != seller_id:
+        return HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=forbidden_detail)
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=category_detail)
 
 
 @router.get("/", response_model=ProductList)
 async def get_all_products(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: int | None = Query(None, ge=1, description="ID последнего товара предыдущей страницы (вместо page)"),
     category_id: int | None = Query(None, description="ID категории для фильтрации"),
     min_price: float | None = Query(None, ge=0, description="Минимальная цена товара"),
     max_price: float | None = Query(None, ge=0, description="Максимальная цена товара"),
@@ -76,6 +120,9 @@ async def get_all_products(
     # Проверка логики min_price <= max_price
     if min_price is not None and max_price is not None and min_price > max_price:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="min_price не может быть больше max_price")
+    # Результаты поиска сортируются по рангу, курсор по ID к ним неприменим
+    if cursor is not None and search:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="cursor нельзя использовать вместе с search")
     
     # Формируем список фильтров
     filters = [ProductModel.is_active == True]
@@ -91,8 +138,6 @@ async def get_all_products(
     if seller_id is not None:
         filters.append(ProductModel.seller_id == seller_id)
 
-    total_stmt = select(func.count()).select_from(ProductModel).where(*filters)
-
     rank_col = None
     if search:
         search_value = search.strip()
@@ -100,38 +145,30 @@ async def get_all_products(
             ts_query = func.websearch_to_tsquery('english', search_value)
             filters.append(ProductModel.tsv.op('@@')(ts_query))
             rank_col = func.ts_rank_cd(ProductModel.tsv, ts_query).label("rank")
-            # total с учетом полнотекстного фильтра
-            total_stmt = select(func.count()).select_from(ProductModel).where(*filters)
 
-    total = await db.scalar(total_stmt) or 0
+    total_stmt = select(func.count()).select_from(ProductModel).where(*filters)
 
     # Основной запрос (если есть поиск - добавим ранг в выборку и сортировку)
+    product_stmt = select(ProductModel).where(*filters)
     if rank_col is not None:
-        product_stmt = (
-            select(ProductModel, rank_col)
-            .where(*filters)
-            .order_by(desc(rank_col), ProductModel.id)
-            .offset((page - 1) * page_size)
-            .limit(page_size)
-        )
-        result = await db.execute(product_stmt)
-        rows = result.all()
-        items = [row[0] for row in rows]
+        product_stmt = product_stmt.add_columns(rank_col).order_by(desc(rank_col), ProductModel.id)
     else:
-        product_stmt = (
-            select(ProductModel)
-            .where(*filters)
-            .order_by(ProductModel.id)
-            .offset((page - 1) * page_size)
-            .limit(page_size)
-        )
-        items = (await db.scalars(product_stmt)).all()
-        
+        product_stmt = product_stmt.order_by(ProductModel.id)
+    if cursor is not None:
+        product_stmt = product_stmt.where(ProductModel.id > cursor)
+    product_stmt = product_stmt.limit(page_size)
+
+    items, total = await fetch_page(db, product_stmt, total_stmt,
+                                    offset=None if cursor is not None else (page - 1) * page_size)
+
+    next_cursor = items[-1].id if rank_col is None and len(items) == page_size else None
+
     return {
         "items": items,
         "total": total,
         "page": page,
         "page_size": page_size,
+        "next_cursor": next_cursor,
     }
 
 @router.post("/", response_model=ProductSchema, status_code=status.HTTP_201_CREATED)
@@ -144,10 +181,7 @@ async def create_product(
     Создаёт новый товар, привязанный к текущему продавцу (только для 'seller').
     """
     if product.category_id is not None:
-        result = await db.scalars(select(CategoryModel).where(CategoryModel.id == product.category_id,
-                                           CategoryModel.is_active == True))
-        category = result.first()
-        if category is None:
+        if not await is_category_active(product.category_id, db):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Категория не найдена или неактивна.")
         
     # Сохранение изображения (если есть)
@@ -164,10 +198,7 @@ async def get_products_by_category(category_id: int, db: AsyncSession = Depends(
     """
     Возвращает список товаров в указанной категории по её ID.
     """
-    result_category = await db.scalars(select(CategoryModel).where(CategoryModel.id == category_id,
-                                                CategoryModel.is_active == True))
-    db_category = result_category.first()
-    if db_category is None:
+    if not await is_category_active(category_id, db):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Категория не найдена или неактивна")
     
     result_product = await db.scalars(select(ProductModel).where(
@@ -183,17 +214,17 @@ async def get_product(product_id: int, db: AsyncSession = Depends(get_async_db))
     """
     Возвращает детальную информацию о товаре по его ID.
     """
-    result_product = await db.scalars(select(ProductModel).where(ProductModel.id == product_id, ProductModel.is_active == True, ProductModel.stock > 0))
+    # Товар и активность его категории проверяем одним запросом с JOIN
+    result_product = await db.scalars(select(ProductModel)
+                                      .join(CategoryModel, CategoryModel.id == ProductModel.category_id)
+                                      .where(ProductModel.id == product_id,
+                                             ProductModel.is_active == True,
+                                             ProductModel.stock > 0,
+                                             CategoryModel.is_active == True))
     db_product = result_product.first()
     if db_product is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Продукт не найден")
     
-    result_category = await db.scalars(select(CategoryModel).where(CategoryModel.id == db_product.category_id,
-                                                CategoryModel.is_active == True))
-    db_category = result_category.first()
-    if db_category is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Категория не найдена")
-    
     return db_product
 
 @router.put("/{product_id}", response_model=ProductSchema)
@@ -206,33 +237,32 @@ async def update_product(
     """
     Обновляет товар, если он принадлежит текущему продавцу (только для 'seller').
     """
-    # Проверка существования продукта
-    result_product = await db.scalars(select(ProductModel).where(ProductModel.id == product_id, ProductModel.is_active == True))
-    db_product = result_product.first()
-    if db_product is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Продукт не найден")
-    if db_product.seller_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Вы можете обновлять только свои собственные продукты")
-    
-    # Проверка существования категории
-    result_category = await db.scalars(select(CategoryModel).where(CategoryModel.id == product.category_id, CategoryModel.is_active == True))
-    db_category = result_category.first()
-    if db_category is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Категория не найдена")
-    
-    # Обновление продукта
-    await db.execute(
+    # Проверка владельца, существования продукта и новой категории выполняется в самом UPDATE
+    category_active = (select(CategoryModel.id)
+                       .where(CategoryModel.id == product.category_id, CategoryModel.is_active == True)
+                       .exists())
+    result = await db.execute(
         update(ProductModel)
-        .where(ProductModel.id == product_id)
+        .where(ProductModel.id == product_id,
+               ProductModel.is_active == True,
+               ProductModel.seller_id == current_user.id,
+               category_active)
         .values(**product.model_dump())
+        .returning(ProductModel),
+        execution_options={"synchronize_session": False, "populate_existing": True},
     )
+    db_product = result.scalars().first()
+    if db_product is None:
+        raise await _product_mutation_error(product_id, current_user.id, db,
+                                            forbidden_detail="Вы можете обновлять только свои собственные продукты",
+                                            category_detail="Категория не найдена")
 
     if image:
-        remove_product_image(db_product.image_url)
+        await remove_product_image(db_product.image_url, product_id, db)
         db_product.image_url = await save_product_image(image)
 
     await db.commit()
-    await db.refresh(db_product)
+    product_reviews_cache.invalidate(product_id)
     return db_product
 
 @router.delete("/{product_id}", status_code=status.HTTP_200_OK)
@@ -242,33 +272,29 @@ async def delete_product(product_id: int,
     """
     Выполняет мягкое удаление товара, если он принадлежит текущему продавцу (только для 'seller').
     """
-    # Проверка существования активного товара.
-    result = await db.scalars(select(ProductModel). where(ProductModel.id == product_id, ProductModel.is_active == True))
-    product = result.first()
-    if product is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Продукт не найден")
-    if product.seller_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Вы можете удалить только свои собственные продукты")
-    
-    # Проверяем, существует ли активная категория
-    category_result = await db.scalars(
-        select(CategoryModel).where(CategoryModel.id == product.category_id,
-                                    CategoryModel.is_active == True)
-    )
-    category = category_result.first()
-    if not category:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail="Категория не найдена или неактивна")
-    
-    # Логическое удаление продукта (установка is_active=False)
-    await db.execute(
+    # Логическое удаление продукта (установка is_active=False) с проверкой владельца
+    # и активной категории в одном UPDATE
+    category_active = (select(CategoryModel.id)
+                       .where(CategoryModel.id == ProductModel.category_id, CategoryModel.is_active == True)
+                       .exists())
+    result = await db.execute(
         update(ProductModel)
-        .where(ProductModel.id == product_id)
+        .where(ProductModel.id == product_id,
+               ProductModel.is_active == True,
+               ProductModel.seller_id == current_user.id,
+               category_active)
         .values(is_active=False)
-        )
+        .returning(ProductModel),
+        execution_options={"synchronize_session": False, "populate_existing": True},
+    )
+    product = result.scalars().first()
+    if product is None:
+        raise await _product_mutation_error(product_id, current_user.id, db,
+                                            forbidden_detail="Вы можете удалить только свои собственные продукты",
+                                            category_detail="Категория не найдена или неактивна")
     
-    remove_product_image(product.image_url)
+    await remove_product_image(product.image_url, product_id, db)
     
     await db.commit()
-    await db.refresh(product)
+    product_reviews_cache.invalidate(product_id)
     return product
\ No newline at end of file
@@ -1,137 +1,249 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select, func, update
+import asyncio
+import logging
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, insert, func, update, case, cast, literal, Numeric, String
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from decimal import Decimal
-from datetime import datetime
 
 from app.schemas import ReviewCreate, Review as ReviewSchema
 from app.models.reviews import Review
 from app.models.products import Product
 from app.models.users import User
+from app.database import async_session_maker
 from app.db_depends import get_async_db
-from app.auth import get_current_user
+from app.auth import require_role
+from app.cache import product_reviews_cache
+from app.responses import ORJSONResponse
 
-router = APIRouter(prefix="/reviews", tags=["reviews"])
+router = APIRouter(prefix="/reviews", tags=["reviews"], default_response_class=ORJSONResponse)
+
+logger = logging.getLogger(__name__)
+
+REVIEWS_STREAM_BATCH_SIZE = 500
+
+# Отложенные сверки: серия отзывов на один товар за окно задержки
+# приводит к одному пересчету
+RATING_RECALC_DELAY = 2.0
+_pending_recalcs: dict[int, asyncio.Task] = {}
+# Сильные ссылки на все запущенные сверки, пока они не завершатся
+_recalc_tasks: set[asyncio.Task] = set()
 
 
 @router.get("/", response_model=list[ReviewSchema])
 async def get_all_reviews(db: AsyncSession = Depends(get_async_db)):
-    result = await db.scalars(
-        select(Review).where(Review.is_active.is_(True))
+    # Отдаем отзывы потоком по мере чтения курсора, не собирая весь список в памяти
+    reviews = await db.stream_scalars(
+        select(Review)
+        .where(Review.is_active.is_(True))
+        .execution_options(yield_per=REVIEWS_STREAM_BATCH_SIZE)
     )
-    reviews = result.all()
-    return reviews
+
+    async def generate_reviews():
+        separator = b"["
+        async for batch in reviews.partitions():
+            yield separator + b",".join(
+                orjson.dumps(ReviewSchema.model_validate(review).model_dump(mode="json")) for review in batch
+            )
+            separator = b","
+        yield b"[]" if separator == b"[" else b"]"
+
+    return StreamingResponse(generate_reviews(), media_type="application/json")
 
 
 @router.get("/products/{product_id}/reviews", response_model=list[ReviewSchema])
 async def get_reviews_for_product(product_id: int, db: AsyncSession = Depends(get_async_db)):
-    # Проверяем, существует ли товар и активен ли он
-    product_result = await db.scalars(
-        select(Product).where(Product.id == product_id, Product.is_active.is_(True))
-    )
-    product = product_result.first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Продукт не найден или неактивен")
-
-    # Получаем активные отзывы для товара
+    cached_body = product_reviews_cache.get(product_id)
+    if cached_body is not None:
+        return Response(content=cached_body, media_type="application/json")
+    # Поколение фиксируем до чтения: если отзыв изменится во время запроса,
+    # устаревший список не попадет в кэш
+    cache_generation = product_reviews_cache.generation(product_id)
+
+    # Получаем активные отзывы только для активного товара
     reviews_result = await db.scalars(
-        select(Review).where(
+        select(Review)
+        .join(Product, Product.id == Review.product_id)
+        .where(
             Review.product_id == product_id,
-            Review.is_active.is_(True)
+            Review.is_active.is_(True),
+            Product.is_active.is_(True)
         )
     )
     reviews = reviews_result.all()
-    return reviews
+
+    # Отдельная проверка товара нужна, только если отзывов нет
+    if not reviews:
+        product_exists = await db.scalar(
+            select(Product.id).where(Product.id == product_id, Product.is_active.is_(True))
+        )
+        if product_exists is None:
+            raise HTTPException(status_code=404, detail="Продукт не найден или неактивен")
+
+    # Сериализуем напрямую через orjson, минуя повторную валидацию по response_model
+    response = ORJSONResponse([ReviewSchema.model_validate(review).model_dump(mode="json") for review in reviews])
+    product_reviews_cache.set(product_id, response.body, generation=cache_generation)
+    return response
+
+
+async def update_product_rating(product_id: int, grade_delta: int, count_delta: int, db: AsyncSession):
+    # Инкрементально меняем сумму и количество оценок и пересчитываем средний рейтинг
+    # из них, не перечитывая все отзывы товара (NULL, если отзывов не осталось)
+    new_sum = Product.rating_sum + grade_delta
+    new_count = Product.rating_count + count_delta
+    await db.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            rating=case((new_count > 0, func.round(cast(new_sum, Numeric) / new_count, 2)), else_=None),
+        ),
+        execution_options={"synchronize_session": False},
+    )
 
 
 async def recalculate_product_rating(product_id: int, db: AsyncSession):
-    # Считаем среднюю оценку по активным отзывам
-    avg_result = await db.scalars(
-        select(func.avg(Review.grade)).where(
+    # Полный пересчет рейтинга по активным отзывам: исправляет возможное
+    # расхождение инкрементальных счетчиков с фактическими данными
+    # Сначала блокируем строку товара: create_review меняет счетчики этой же строки,
+    # и без блокировки UPDATE мог бы записать агрегаты из снимка, сделанного до
+    # ожидания чужой транзакции. После блокировки следующий запрос видит все
+    # зафиксированные отзывы
+    await db.execute(select(Product.id).where(Product.id == product_id).with_for_update())
+
+    # Агрегаты и округление считаются в PostgreSQL, обновление выполняется одним запросом.
+    # Агрегат без GROUP BY всегда дает одну строку, даже если отзывов не осталось
+    stats = (
+        select(
+            func.count(Review.id).label("rating_count"),
+            func.coalesce(func.sum(Review.grade), 0).label("rating_sum"),
+            func.round(func.avg(Review.grade), 2).label("rating"),
+        ).where(
             Review.product_id == product_id,
             Review.is_active.is_(True)
         )
+        .subquery()
     )
-    avg_grade = avg_result.first()
-
-    # Обновляем rating в товаре (может быть NULL, если отзывов нет)
-    new_rating = Decimal(str(round(avg_grade, 2))) if avg_grade is not None else None
-
     await db.execute(
         update(Product)
         .where(Product.id == product_id)
-        .values(rating=new_rating)
+        .values(rating_sum=stats.c.rating_sum, rating_count=stats.c.rating_count, rating=stats.c.rating),
+        execution_options={"synchronize_session": False},
     )
 
+async def _recalc_in_new_session(product_id: int):
+    # Фоновая задача выполняется после ответа, когда сессия запроса уже закрыта,
+    # поэтому открываем собственную
+    # Результат задачи никто не ожидает, поэтому ошибки логируем здесь
+    try:
+        async with async_session_maker() as db:
+            await recalculate_product_rating(product_id, db)
+            await db.commit()
+    except Exception:
+        logger.exception("Не удалось пересчитать рейтинг товара %s", product_id)
+
+
+async def _delayed_recalc(product_id: int):
+    await asyncio.sleep(RATING_RECALC_DELAY)
+    # Снимаем отметку до пересчета, чтобы отзывы, пришедшие во время него,
+    # запланировали следующую сверку
+    _pending_recalcs.pop(product_id, None)
+    await _recalc_in_new_session(product_id)
+
+
+def schedule_rating_recalc(product_id: int):
+    pending = _pending_recalcs.get(product_id)
+    if pending is None or pending.done():
+        task = asyncio.create_task(_delayed_recalc(product_id))
+        _pending_recalcs[product_id] = task
+        _recalc_tasks.add(task)
+        task.add_done_callback(_recalc_tasks.discard)
+
 
 @router.post("/", response_model=ReviewSchema, status_code=status.HTTP_201_CREATED)
 async def create_review(
     review_data: ReviewCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(require_role("buyer", "Отзывы могут оставлять только покупатели")),
     db: AsyncSession = Depends(get_async_db)
 ):
-    # Проверка роли: только "buyer"
-    if current_user.role != "buyer":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Отзывы могут оставлять только покупатели"
+    # Создаём отзыв: строка вставляется, только если товар существует и активен
+    new_review = (
+        insert(Review)
+        .from_select(
+            ["user_id", "product_id", "comment", "grade", "is_active"],
+            select(
+                literal(current_user.id),
+                Product.id,
+                literal(review_data.comment, String),
+                literal(review_data.grade),
+                literal(True),
+            ).where(
+                Product.id == review_data.product_id,
+                Product.is_active.is_(True)
+            )
         )
-
-    # Проверяем, существует ли товар и активен ли он
-    product_result = await db.scalars(
-        select(Product).where(
-            Product.id == review_data.product_id,
-            Product.is_active.is_(True)
+        .returning(
+            Review.id, Review.user_id, Review.product_id, Review.comment,
+            Review.comment_date, Review.grade, Review.is_active,
         )
+        .cte("new_review")
     )
-    product = product_result.first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Продукт не найден или неактивен")
 
-    # Создаём отзыв
-    new_review = Review(
-        user_id=current_user.id,
-        product_id=review_data.product_id,
-        comment=review_data.comment,
-        grade=review_data.grade,
-        comment_date=datetime.now(),
-        is_active=True
-    )
-    db.add(new_review)
+    # Вставка отзыва и обновление рейтинга товара выполняются одним запросом:
+    # UPDATE берет оценку из CTE и возвращает созданный отзыв
+    new_sum = Product.rating_sum + new_review.c.grade
+    new_count = Product.rating_count + 1
+    try:
+        result = await db.execute(
+            update(Product)
+            .where(Product.id == new_review.c.product_id)
+            .values(
+                rating_sum=new_sum,
+                rating_count=new_count,
+                rating=func.round(cast(new_sum, Numeric) / new_count, 2),
+            )
+            .returning(*new_review.c),
+            execution_options={"synchronize_session": False},
+        )
+        review = result.first()
+        await db.commit()
+    except IntegrityError:
+        # Повторный отзыв отсекается частичным уникальным индексом
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Вы уже оставляли отзыв на этот товар")
+    if review is None:
+        raise HTTPException(status_code=404, detail="Продукт не найден или неактивен")
 
-    # Пересчитываем рейтинг
-    await recalculate_product_rating(review_data.product_id, db)
-
-    await db.commit()
-    await db.refresh(new_review)
-    return new_review
+    product_reviews_cache.invalidate(review_data.product_id)
+    schedule_rating_recalc(review_data.product_id)
+    return review
 
 
 @router.delete("/{review_id}")
 async def delete_review(
     review_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(require_role("admin", "Удалять отзывы могут только администраторы")),
     db: AsyncSession = Depends(get_async_db)
 ):
-    if current_user.role != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Удалять отзывы могут только администраторы"
-        )
-
-    # Находим отзыв
-    review_result = await db.scalars(
-        select(Review).where(Review.id == review_id, Review.is_active.is_(True))
+    # Мягкое удаление одним запросом; возвращаем товар и оценку для пересчета рейтинга
+    review_result = await db.execute(
+        update(Review)
+        .where(Review.id == review_id, Review.is_active.is_(True))
+        .values(is_active=False)
+        .returning(Review.product_id, Review.grade),
+        execution_options={"synchronize_session": False},
     )
     review = review_result.first()
-    if not review:
+    if review is None:
         raise HTTPException(status_code=404, detail="Отзыв не найден или удален")
 
-    # Мягкое удаление
-    review.is_active = False
-
-    # Пересчитываем рейтинг товара
-    await recalculate_product_rating(review.product_id, db)
+    # Обновляем рейтинг товара
+    await update_product_rating(review.product_id, -review.grade, -1, db)
 
     await db.commit()
+    product_reviews_cache.invalidate(review.product_id)
+    schedule_rating_recalc(review.product_id)
     return {"message": "Review deleted"}
\ No newline at end of file
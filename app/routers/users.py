@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from fastapi.security import OAuth2PasswordRequestForm
@@ -30,7 +31,7 @@ async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)
     # Создание объекта пользователя с хэшированным паролем
     db_user = UserModel(
         email=user.email,
-        hashed_password=hash_password(user.password),
+        hashed_password=await run_in_threadpool(hash_password, user.password),
         role=user.role
     )
 
@@ -49,7 +50,8 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(),
     result = await db.scalars(select(UserModel)
                               .where(UserModel.email == form_data.username, UserModel.is_active == True))
     user = result.first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    # bcrypt намеренно медленный, поэтому проверяем пароль вне цикла событий
+    if not user or not await run_in_threadpool(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
@@ -94,6 +94,7 @@ class ProductList(BaseModel):
     total: int = Field(ge=0, description="Общее количество товаров")
     page: int = Field(ge=1, description="Номер текущей страницы")
     page_size: int = Field(ge=1, description="Количество элементов на странице")
+    next_cursor: int | None = Field(None, description="Курсор для запроса следующей страницы")
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -195,5 +196,6 @@ class OrderList(BaseModel):
     total: int = Field(ge=0, description="Общее количество заказов")
     page: int = Field(ge=1, description="Текущая страница")
     page_size: int = Field(ge=1, description="Размер страницы")
+    next_cursor: int | None = Field(None, description="Курсор для запроса следующей страницы")
 
     model_config = ConfigDict(from_attributes=True)
\ No newline at end of file